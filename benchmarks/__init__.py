@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Tamia released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division, absolute_import, unicode_literals)
+
+from .generator import RepoShape, generate
+from .runner import run, compare
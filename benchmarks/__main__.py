@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Tamia released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division, absolute_import, unicode_literals)
+
+import argparse
+import json
+import os.path
+from shutil import rmtree
+import sys
+from tempfile import mkdtemp
+
+from .generator import RepoShape, generate
+from .runner import compare, run
+from .scenarios import SCENARIOS
+
+
+def main(args=None):
+    defaults = RepoShape()
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Tamia benchmark suite')
+    parser.add_argument('--commits', type=int, default=defaults.commits)
+    parser.add_argument('--depth', type=int, default=defaults.depth)
+    parser.add_argument('--width', type=int, default=defaults.width)
+    parser.add_argument('--files', type=int, default=defaults.files)
+    parser.add_argument('--file-size', type=int, default=defaults.file_size)
+    parser.add_argument('--changes', type=int, default=defaults.changes)
+    parser.add_argument('--merge-every', type=int, default=defaults.merge_every)
+    parser.add_argument('--refs', type=int, default=defaults.refs)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--timeout', type=int, default=600,
+                        help='Seconds allowed per scenario (default: 600)')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS.keys(),
+                        help='Scenario to run (default: all)')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    parser.add_argument('--baseline', help='JSON results to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Allowed slowdown ratio (default: 0.1)')
+    opts = parser.parse_args(args)
+
+    shape = RepoShape(commits=opts.commits, depth=opts.depth,
+                      width=opts.width, files=opts.files,
+                      file_size=opts.file_size, changes=opts.changes,
+                      merge_every=opts.merge_every, refs=opts.refs)
+
+    tmp = mkdtemp()
+    try:
+        path = os.path.join(tmp, 'bench.git')
+        generate(path, shape, opts.seed)
+        results = run(path, shape, opts.scenario, opts.repeat,
+                      opts.timeout)
+    finally:
+        rmtree(tmp)
+
+    results['meta']['seed'] = opts.seed
+    data = json.dumps(results, indent=2, sort_keys=True)
+    if opts.output:
+        with open(opts.output, 'w') as fp:
+            fp.write(data)
+    else:
+        print(data)
+
+    if opts.baseline:
+        with open(opts.baseline) as fp:
+            regressions = compare(results, json.load(fp), opts.threshold)
+
+        for name, before, after, ratio in regressions:
+            print('{0}: {1:.4f}s -> {2:.4f}s ({3:+.0%})'.format(
+                name, before, after, ratio - 1), file=sys.stderr)
+
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Tamia released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division, absolute_import, unicode_literals)
+
+import os.path
+import random
+
+import pygit2
+
+
+WORDS = ('alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf',
+         'hotel', 'india', 'juliet', 'kilo', 'lima', 'mike', 'november',
+         'oscar', 'papa', 'quebec', 'romeo', 'sierra', 'tango', 'uniform')
+
+
+class RepoShape(object):
+    """
+    Shape of a generated repository.
+
+    The tree holds ``width`` sub-directories per directory down to ``depth``
+    levels, each directory containing ``files`` files of about ``file_size``
+    bytes. Every commit modifies ``changes`` files, a merge is created every
+    ``merge_every`` commits (0 disables merges) and ``refs`` branches and tags
+    are spread over the history.
+    """
+    def __init__(self, commits=100, depth=3, width=3, files=5, file_size=2048,
+                 changes=3, merge_every=10, refs=10):
+        self.commits = commits
+        self.depth = depth
+        self.width = width
+        self.files = files
+        self.file_size = file_size
+        self.changes = changes
+        self.merge_every = merge_every
+        self.refs = refs
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+    def paths(self):
+        """
+        Return every file path of the generated tree, depth-first.
+        """
+        result = []
+
+        def walk(prefix, level):
+            for i in range(self.files):
+                result.append(os.path.join(prefix, 'file{0}.txt'.format(i)))
+            if level < self.depth:
+                for i in range(self.width):
+                    walk(os.path.join(prefix, 'dir{0}'.format(i)), level + 1)
+
+        walk('', 0)
+        return result
+
+
+class _Dir(object):
+    """
+    Mutable directory state that remembers its tree oid until modified.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.oid = None
+
+    def set(self, parts, oid):
+        self.oid = None
+        name = parts[0]
+        if len(parts) == 1:
+            previous = self.entries.get(name)
+            if oid is None:
+                self.entries.pop(name, None)
+            else:
+                self.entries[name] = oid
+            return previous
+
+        child = self.entries.setdefault(name, _Dir())
+        return child.set(parts[1:], oid)
+
+    def write(self, repo):
+        if self.oid is None:
+            builder = repo.TreeBuilder()
+            for name, value in self.entries.items():
+                if isinstance(value, _Dir):
+                    builder.insert(name, value.write(repo),
+                                   pygit2.GIT_FILEMODE_TREE)
+                else:
+                    builder.insert(name, value, pygit2.GIT_FILEMODE_BLOB)
+            self.oid = builder.write()
+
+        return self.oid
+
+
+class _Generator(object):
+    def __init__(self, repo, shape, seed):
+        self._repo = repo
+        self._shape = shape
+        self._random = random.Random(seed)
+        self._root = _Dir()
+        self._paths = shape.paths()
+        self._versions = dict.fromkeys(self._paths, 0)
+        self._time = 1400000000
+        self._commits = []
+
+    def content(self, path, version):
+        rnd = random.Random('{0}:{1}'.format(path, version))
+        base = random.Random(path)
+        lines = []
+        size = 0
+        i = 0
+        while size < self._shape.file_size:
+            # Each version rewrites about one line out of ten so diffs
+            # produce realistic hunks instead of whole-file rewrites.
+            source = rnd if (i + version) % 10 == 0 else base
+            line = ' '.join(source.choice(WORDS) for _ in range(8)) + '\n'
+            lines.append(line)
+            size += len(line)
+            i += 1
+
+        return ''.join(lines).encode('UTF-8')
+
+    def set_file(self, path, version):
+        self._versions[path] = version
+        oid = self._repo.create_blob(self.content(path, version))
+        return self._root.set(path.split('/'), oid)
+
+    def signature(self):
+        self._time += 3600
+        n = self._random.randint(0, 9)
+        return pygit2.Signature('Author {0}'.format(n),
+                                'author{0}@example.net'.format(n),
+                                self._time, 0)
+
+    def commit(self, message, parents, ref=None):
+        sig = self.signature()
+        tree = self._root.write(self._repo)
+        oid = self._repo.create_commit(ref, sig, sig, message, tree, parents)
+        return oid
+
+    def touch(self):
+        """
+        Bump ``changes`` random files and return their previous blob oids.
+        """
+        paths = self._random.sample(self._paths,
+                                    min(self._shape.changes, len(self._paths)))
+        return [(p, self.set_file(p, self._versions[p] + 1)) for p in paths]
+
+    def run(self):
+        for path in self._paths:
+            self.set_file(path, 0)
+
+        head = self.commit('Initial commit', [], 'refs/heads/master')
+        self._commits.append(head)
+
+        for i in range(1, self._shape.commits):
+            if self._shape.merge_every and i % self._shape.merge_every == 0:
+                head = self.merge(head, i)
+            else:
+                self.touch()
+                head = self.commit('Commit {0}'.format(i), [head],
+                                   'refs/heads/master')
+            self._commits.append(head)
+
+        self.create_refs()
+        return head
+
+    def merge(self, head, i):
+        # Topic commit on top of head
+        touched = self.touch()
+        topic = self.commit('Topic {0}'.format(i), [head])
+
+        # Revert topic changes, then commit on the main line
+        topic_oids = []
+        for path, previous in touched:
+            topic_oids.append((path, self._root.set(path.split('/'), previous)))
+        self.touch()
+        main = self.commit('Commit {0}'.format(i), [head])
+
+        # Re-apply topic changes and merge
+        for path, oid in topic_oids:
+            self._root.set(path.split('/'), oid)
+
+        return self.commit('Merge topic {0}'.format(i), [main, topic],
+                           'refs/heads/master')
+
+    def create_refs(self):
+        count = self._shape.refs
+        if not count:
+            return
+
+        step = max(1, len(self._commits) // count)
+        for n, i in enumerate(range(0, len(self._commits), step)[:count]):
+            kind = n % 2 and 'tags' or 'heads'
+            name = 'refs/{0}/bench-{1}'.format(kind, n)
+            self._repo.create_reference(name, self._commits[i])
+
+
+def generate(path, shape=None, seed=0):
+    """
+    Create a bare repository in ``path`` shaped after ``shape`` and return
+    the pygit2 repository. The same shape and seed always produce the same
+    objects.
+    """
+    repo = pygit2.init_repository(path, True)
+    _Generator(repo, shape or RepoShape(), seed).run()
+
+    return repo
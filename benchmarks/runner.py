@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Tamia released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division, absolute_import, unicode_literals)
+
+import multiprocessing
+import os.path
+import platform
+from Queue import Empty
+import resource
+from shutil import copytree, rmtree
+from tempfile import mkdtemp
+import time
+from timeit import default_timer
+
+import pygit2
+
+from .scenarios import SCENARIOS
+
+
+def _peak_rss():
+    # ru_maxrss is expressed in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _measure(name, path, shape, repeat, queue):
+    try:
+        func = SCENARIOS[name](path, shape)
+
+        # Baseline before the first call: ru_maxrss is a high-water mark, so
+        # the warm-up run has to be part of the measured peak.
+        rss = _peak_rss()
+        func()  # warm-up
+
+        timings = []
+        for i in range(repeat):
+            start = default_timer()
+            func()
+            timings.append(default_timer() - start)
+
+        peak = _peak_rss()
+        queue.put({'timings': timings, 'peak_rss_kb': peak,
+                   'rss_delta_kb': peak - rss})
+    except Exception as e:
+        queue.put({'error': '{0}: {1}'.format(e.__class__.__name__, e)})
+
+
+def _summary(timings):
+    timings = sorted(timings)
+    n = len(timings)
+    median = (timings[(n - 1) // 2] + timings[n // 2]) / 2
+
+    return {
+        'min': timings[0],
+        'max': timings[-1],
+        'mean': sum(timings) / n,
+        'median': median,
+        'repeat': n,
+    }
+
+
+def _wait(process, queue, timeout):
+    """
+    Return the data sent by a scenario process, or an error if it died or
+    did not answer within ``timeout`` seconds.
+    """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            if not process.is_alive():
+                # Data may have been sent right before the process exited
+                try:
+                    return queue.get(timeout=1)
+                except Empty:
+                    pass
+                return {'error': 'Process exited with code {0}'.format(
+                    process.exitcode)}
+            if time.time() > deadline:
+                process.terminate()
+                return {'error': 'Timeout after {0}s'.format(timeout)}
+
+
+def run(path, shape, names=None, repeat=5, timeout=600):
+    """
+    Run scenarios against the repository in ``path`` and return a result
+    mapping suitable for JSON serialization.
+
+    Each scenario runs in its own process on a private copy of the
+    repository, so scenarios writing objects do not influence each other and
+    peak memory is tracked per scenario: ``peak_rss_kb`` is the process peak
+    and ``rss_delta_kb`` its growth over the scenario setup.
+    """
+    results = {}
+
+    for name in names or SCENARIOS.keys():
+        tmp = mkdtemp()
+        try:
+            repo_path = os.path.join(tmp, 'repo.git')
+            copytree(path, repo_path)
+
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=_measure, args=(name, repo_path, shape, repeat, queue))
+            process.start()
+            data = _wait(process, queue, timeout)
+            process.join()
+        finally:
+            rmtree(tmp)
+
+        if 'error' in data:
+            results[name] = data
+        else:
+            results[name] = _summary(data['timings'])
+            results[name]['peak_rss_kb'] = data['peak_rss_kb']
+            results[name]['rss_delta_kb'] = data['rss_delta_kb']
+
+    return {
+        'meta': {
+            'shape': shape.as_dict(),
+            'python': platform.python_version(),
+            'pygit2': pygit2.__version__,
+            'libgit2': pygit2.LIBGIT2_VERSION,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=0.1):
+    """
+    Compare two results mappings on median time. Return a list of
+    ``(name, baseline, current, ratio)`` for scenarios slower than
+    ``threshold`` (a fraction) compared to the baseline.
+    """
+    regressions = []
+
+    for name, data in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+        if not base or 'median' not in base or 'median' not in data:
+            continue
+
+        ratio = data['median'] / base['median'] if base['median'] else 0
+        if ratio > 1 + threshold:
+            regressions.append((name, base['median'], data['median'], ratio))
+
+    return regressions
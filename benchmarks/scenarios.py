@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Tamia released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division, absolute_import, unicode_literals)
+
+from collections import OrderedDict
+
+from tamia import Repository
+from tamia.diffcache import MemoryStore
+from tamia.index import Index
+from tamia.stats import StatsCache
+
+
+SCENARIOS = OrderedDict()
+
+
+def scenario(func):
+    """
+    Register a scenario. A scenario receives a repository path and its shape,
+    does its setup and returns the callable to time.
+    """
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+def _deepest(shape):
+    return max(shape.paths(), key=lambda x: (x.count('/'), x))
+
+
+@scenario
+def history(path, shape):
+    repo = Repository(path)
+
+    def run():
+        for x in repo.history():
+            pass
+
+    return run
+
+
+@scenario
+def node_children(path, shape):
+    repo = Repository(path)
+
+    def run():
+        for x in repo.get_revision().node().children(recursive=True):
+            pass
+
+    return run
+
+
+@scenario
+def node_lookup(path, shape):
+    repo = Repository(path)
+    paths = shape.paths()
+
+    def run():
+        revision = repo.get_revision()
+        for p in paths:
+            revision.node(p)
+
+    return run
+
+
+@scenario
+def node_history(path, shape):
+    repo = Repository(path)
+    node = repo.get_revision().node(_deepest(shape))
+
+    def run():
+        for x in node.history():
+            pass
+
+    return run
+
+
+@scenario
+def diff(path, shape):
+    repo = Repository(path)
+    depth = min(10, shape.commits - 1)
+
+    def run():
+        # Cold cache, the diff would be reused otherwise
+        repo._diff_cache.store = MemoryStore(repo.DIFF_CACHE_BYTES)
+        d = repo.diff('HEAD', 'HEAD~{0}'.format(depth))
+        for patch in d:
+            pass
+        d.patch
+
+    return run
+
+
+@scenario
+def file_read(path, shape):
+    repo = Repository(path)
+    paths = shape.paths()
+
+    def run():
+        revision = repo.get_revision()
+        for p in paths:
+            revision.node(p).open().read()
+
+    return run
+
+
+@scenario
+def index_commit(path, shape):
+    repo = Repository(path)
+    paths = shape.paths()[:shape.changes * 10]
+
+    def run():
+        index = Index(repo)
+        index.set_revision('HEAD')
+        for i, p in enumerate(paths):
+            index.add(p, 'benchmark {0}\n'.format(i))
+        index.add('bench/new/file.txt', 'new file\n')
+        index.commit('Benchmark commit', 'Bench', 'bench@example.net')
+
+    return run
+
+
+@scenario
+def node_stats(path, shape):
+    repo = Repository(path)
+
+    def run():
+        # Cold cache, the aggregates would be reused otherwise
+        repo._stats = StatsCache(repo._repo, repo.STATS_CACHE_SIZE)
+        repo.get_revision().node().stats(largest=10)
+
+    return run
+
+
+@scenario
+def changes(path, shape):
+    repo = Repository(path)
+    depth = min(10, shape.commits - 1)
+
+    def run():
+        for x in repo.changes('HEAD~{0}'.format(depth), 'HEAD'):
+            pass
+
+    return run
+
+
+@scenario
+def log_store(path, shape):
+    repo = Repository(path)
+    repo.enable_commit_store()
+
+    def run():
+        for offset in range(0, shape.commits, 50):
+            repo.log(offset=offset, limit=50)
+
+    return run
+
+
+@scenario
+def read_many(path, shape):
+    repo = Repository(path)
+    paths = shape.paths()
+
+    def run():
+        for x in repo.get_revision().read_many(paths):
+            pass
+
+    return run
+
+
+@scenario
+def diff_cached(path, shape):
+    repo = Repository(path)
+    depth = min(10, shape.commits - 1)
+    repo.diff('HEAD', 'HEAD~{0}'.format(depth)).patch
+
+    def run():
+        for i in range(depth):
+            repo.diff('HEAD~{0}'.format(i), 'HEAD~{0}'.format(i + 1)).patch
+
+    return run
+
+
+@scenario
+def analytics(path, shape):
+    repo = Repository(path)
+
+    def run():
+        repo.analytics('HEAD', workers=2)
+
+    return run
@@ -0,0 +1,14 @@
+from tamia import Repository
+
+
+def progress(remote, stats):
+    print "%s: %d/%d objects" % (remote, stats.received_objects,
+                                 stats.total_objects)
+
+repo = Repository("path_to_repo")
+
+# fetch every remote, four at a time
+for remote, result in repo.fetch_all(workers=4, progress=progress).items():
+    print remote, result
+
+repo.pull("origin", "master")
@@ -25,7 +25,7 @@ cd ${SRC}/libgit2
 git checkout v0.21.0
 rm -rf build && mkdir build
 cd build
-cmake .. -DCMAKE_INSTALL_PREFIX=${TARGET}
+cmake .. -DCMAKE_INSTALL_PREFIX=${TARGET} -DTHREADSAFE=ON
 cmake --build . --target install
 
 # Building pygit2
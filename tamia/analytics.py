@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Tamia released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division,
+                        absolute_import, unicode_literals)
+
+import json
+from multiprocessing import Pool
+import os
+
+import pygit2
+
+
+class ChurnStats(object):
+    """
+    Churn counters. ``paths`` and ``authors`` map a path or an author email
+    to ``[commits, added lines, deleted lines]``.
+    """
+    def __init__(self, commits=0, paths=None, authors=None):
+        self.commits = commits
+        self.paths = paths or {}
+        self.authors = authors or {}
+
+    def __repr__(self):
+        return '<{0}: {1} commits, {2} paths, {3} authors>'.format(
+            self.__class__.__name__, self.commits, len(self.paths),
+            len(self.authors))
+
+    def add(self, author, changes):
+        """
+        Count a commit of ``author`` changing ``(path, added, deleted)``.
+        """
+        if not changes:
+            return
+
+        self.commits += 1
+        total = self.authors.setdefault(author, [0, 0, 0])
+        total[0] += 1
+
+        for path, added, deleted in changes:
+            counter = self.paths.setdefault(path, [0, 0, 0])
+            counter[0] += 1
+            counter[1] += added
+            counter[2] += deleted
+            total[1] += added
+            total[2] += deleted
+
+    def update(self, other):
+        self.commits += other.commits
+        for mine, theirs in ((self.paths, other.paths),
+                             (self.authors, other.authors)):
+            for key, value in theirs.items():
+                counter = mine.setdefault(key, [0, 0, 0])
+                for i in range(3):
+                    counter[i] += value[i]
+
+    def as_dict(self):
+        return {'commits': self.commits, 'paths': self.paths,
+                'authors': self.authors}
+
+
+def _match(path, paths):
+    return paths is None or any(path == p or path.startswith(p + '/')
+                                for p in paths)
+
+
+# Repository of a pool worker process, see _init_worker()
+_repository = None
+
+
+def _init_worker(repo_path):
+    global _repository
+    _repository = pygit2.Repository(repo_path)
+
+
+def _analyze(repo, ids, paths):
+    """
+    Compute churn of a list of commits against their first parent.
+    """
+    stats = ChurnStats()
+    for _id in ids:
+        commit = repo[pygit2.Oid(hex=_id)]
+
+        # No context lines, only line counts are needed
+        if commit.parents:
+            diff = commit.parents[0].tree.diff_to_tree(commit.tree, 0, 0)
+        else:
+            diff = commit.tree.diff_to_tree(swap=True, context_lines=0)
+
+        changes = []
+        for p in diff:
+            path = p.new_file_path.decode('UTF-8')
+            if _match(path, paths):
+                changes.append((path, p.additions, p.deletions))
+
+        stats.add(commit.author.email, changes)
+
+    return stats.as_dict()
+
+
+def _analyze_chunk(args):
+    # Run in pool processes, so it only gets picklable arguments
+    i, ids, paths = args
+    return i, _analyze(_repository, ids, paths)
+
+
+class _Checkpoint(object):
+    """
+    Partial results saved after each chunk so an interrupted run can resume.
+    """
+    def __init__(self, path, signature):
+        self.path = path
+        self.signature = signature
+        self.done = set()
+        self.stats = ChurnStats()
+
+        if path and os.path.exists(path):
+            with open(path) as fp:
+                data = json.load(fp)
+            if data.get('signature') == signature:
+                self.done = set(data['done'])
+                self.stats = ChurnStats(**data['stats'])
+
+    def save(self):
+        if not self.path:
+            return
+
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as fp:
+            json.dump({'signature': self.signature,
+                       'done': sorted(self.done),
+                       'stats': self.stats.as_dict()}, fp)
+        os.rename(tmp, self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def churn(repo, ids, paths=None, workers=None, progress=None,
+          checkpoint=None, chunk_size=100):
+    """
+    Aggregate churn of commits ``ids`` of the pygit2 repository ``repo``,
+    in chunks of ``chunk_size`` commits diffed in ``workers`` processes.
+    ``progress`` is called with the number of analyzed commits and the total
+    after each chunk.
+
+    With a ``checkpoint`` file, partial results are saved after each chunk
+    and reused by a later call on the same commits.
+    """
+    chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+    signature = [ids and ids[0], ids and ids[-1], len(ids), chunk_size, paths]
+    state = _Checkpoint(checkpoint, signature)
+
+    todo = [(i, x, paths) for i, x in enumerate(chunks) if i not in state.done]
+    count = sum(len(chunks[i]) for i in state.done)
+
+    def results():
+        if workers:
+            pool = Pool(workers, _init_worker, (repo.path,))
+            try:
+                for x in pool.imap_unordered(_analyze_chunk, todo):
+                    yield x
+            finally:
+                pool.terminate()
+        else:
+            for i, ids, paths in todo:
+                yield i, _analyze(repo, ids, paths)
+
+    for i, result in results():
+        state.stats.update(ChurnStats(**result))
+        state.done.add(i)
+        state.save()
+
+        count += len(chunks[i])
+        if progress is not None:
+            progress(count, len(ids))
+
+    state.remove()
+    return state.stats
@@ -6,17 +6,30 @@ from __future__ import (division, absolute_import,
                         unicode_literals)
 
 from datetime import datetime
+from itertools import islice
+from multiprocessing.pool import ThreadPool
 import os.path
 from StringIO import StringIO
 
 import pygit2
 
-from .errors import RepositoryNotFound, NodeNotFound, RevisionNotFound
+from .analytics import churn
+from .cache import PathCache
+from .changes import tree_changes
+from .diffcache import DiffCache, DiskStore, MemoryStore
+from .errors import (RepositoryNotFound, NodeNotFound, RevisionNotFound,
+                     RemoteError, MergeConflict, TamiaError)
 from .index import Index
-from .utils import clean_path, TZ
+from .stats import NodeStats, StatsCache
+from .store import CommitStore, commit_record
+from .utils import clean_path, timestamp, TZ
 
 
 class Repository(object):
+    PATH_CACHE_SIZE = 10000
+    STATS_CACHE_SIZE = 10000
+    DIFF_CACHE_BYTES = 64 * 1024 * 1024
+
     def __init__(self, repo_path, repo=None, create=False, **kwargs):
         if repo:
             self._repo = repo
@@ -34,6 +47,12 @@ class Repository(object):
         self.is_empty = self._repo.is_empty
         self.is_bare = self._repo.is_bare
 
+        self._path_cache = PathCache(self._repo, self.PATH_CACHE_SIZE)
+        self._stats = StatsCache(self._repo, self.STATS_CACHE_SIZE)
+        self._diff_cache = DiffCache(self._repo,
+                                     MemoryStore(self.DIFF_CACHE_BYTES))
+
+        self._store = None
         self._ref_map = {}
         self._set_refs()
 
@@ -72,21 +91,205 @@ class Repository(object):
 
             self._ref_map[refid][reftype].append(refname)
 
+        if self._store is not None:
+            self._store.update()
+
+    def close(self):
+        """
+        Close the persistent stores enabled on the repository.
+        """
+        self._stats.close()
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def enable_stats_store(self, path=None):
+        """
+        Persist directory aggregates computed by ``Node.stats()`` in ``path``
+        (default: ``tamia/stats`` in the git directory).
+        """
+        self._stats.open(path or os.path.join(self.path, 'tamia', 'stats'))
+
+    def enable_diff_store(self, path=None, maxbytes=None):
+        """
+        Keep diff results on disk in ``path`` (default: ``tamia/diffs`` in
+        the git directory), shared by every process using the same path.
+        """
+        path = path or os.path.join(self.path, 'tamia', 'diffs')
+        self._diff_cache.store = DiskStore(path,
+                                           maxbytes or self.DIFF_CACHE_BYTES)
+
+    def enable_commit_store(self, path=None):
+        """
+        Keep commit metadata in a SQLite database in ``path`` (default:
+        ``tamia/commits.db`` in the git directory) and answer ``log()``
+        queries from it. The store is updated when references change.
+        """
+        path = path or os.path.join(self.path, 'tamia', 'commits.db')
+        self._store = CommitStore(self._repo, path)
+        self._store.update()
+
+        return self._store
+
     def push(self, remote_name, branch):
         remote = self.get_remote(remote_name)
         remote.push("refs/remotes/%s/%s" % (remote_name, branch))
 
     def get_remote(self, name):
-        remote = [remote for remote in self._repo.remotes
-                  if remote.name == name]
+        return _get_remote(self._repo, name)
+
+    def _update_refs(self, changes):
+        """
+        Apply ``(refname, old oid, new oid)`` changes to the reference map,
+        ``None`` standing for a missing reference.
+        """
+        for refname, old, new in changes:
+            parts = refname.split('/', 2)
+            if len(parts) != 3 or parts[0] != 'refs':
+                continue
+
+            reftype = parts[1]
+            refname = parts[2]
+
+            if old is not None:
+                names = self._ref_map.get(old, {}).get(reftype, [])
+                if refname in names:
+                    names.remove(refname)
+
+            if new is not None:
+                names = self._ref_map.setdefault(new, {}).setdefault(reftype, [])
+                if refname not in names:
+                    names.append(refname)
+
+        if self._store is not None:
+            self._store.update()
+
+    def fetch(self, remote_name, progress=None):
+        """
+        Fetch a remote and return its transfer statistics. ``progress`` is
+        called with the statistics while objects are received.
+        """
+        name, stats, changes = _fetch(self._repo, remote_name, progress)
+        self._update_refs(changes)
+
+        if isinstance(stats, Exception):
+            raise stats
+
+        return stats
+
+    def fetch_all(self, remotes=None, workers=None, progress=None):
+        """
+        Fetch several remotes (default: all of them) using ``workers``
+        threads, and return a mapping of remote names to their transfer
+        statistics, or to the exception raised while fetching.
+
+        ``progress`` is called with the remote name and its statistics, from
+        the fetching threads. Using ``workers`` requires libgit2 to be built
+        with thread support (``-DTHREADSAFE=ON``).
+        """
+        if workers and not pygit2.features & pygit2.GIT_FEATURE_THREADS:
+            raise TamiaError('libgit2 is not built with thread support')
+
+        if remotes is None:
+            remotes = [x.name for x in self._repo.remotes]
+
+        def fetch(name):
+            try:
+                # libgit2 repositories should not be shared between threads
+                repo = pygit2.Repository(self.path) if workers else self._repo
+            except Exception as e:
+                return name, RemoteError('Cannot fetch "{0}": {1}'.format(
+                    name, e)), []
+
+            callback = progress and (lambda stats: progress(name, stats))
+            return _fetch(repo, name, callback)
+
+        if workers:
+            pool = ThreadPool(workers)
+            results = pool.imap_unordered(fetch, remotes)
+        else:
+            pool = None
+            results = (fetch(x) for x in remotes)
+
+        # References are updated as soon as each remote is fetched, so an
+        # interruption leaves the reference map in line with the disk.
+        result = {}
+        try:
+            for name, stats, changes in results:
+                self._update_refs(changes)
+                result[name] = stats
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        return result
+
+    def pull(self, remote_name, branch, author_name=None, author_email=None,
+             progress=None):
+        """
+        Fetch ``remote_name`` and integrate its ``branch`` into the local
+        branch of the same name, fast-forwarding it when possible and
+        creating a merge commit otherwise. Like ``Index.commit()``, only
+        references are updated, the working directory is left untouched.
+
+        Return the new id of the local branch.
+        """
+        self.fetch(remote_name, progress)
+
+        try:
+            theirs = self._repo.lookup_reference(
+                'refs/remotes/{0}/{1}'.format(remote_name, branch)).target
+        except KeyError:
+            raise RemoteError('Branch "{0}" does not exist on "{1}"'.format(
+                branch, remote_name))
+
+        local = 'refs/heads/{0}'.format(branch)
+        try:
+            ours = self._repo.lookup_reference(local).target
+        except KeyError:
+            ours = None
+
+        if ours is not None:
+            base = self._repo.merge_base(ours, theirs)
+            if base == theirs:
+                return ours.hex
+            if base is None:
+                raise MergeConflict('No common ancestor between "{0}" and '
+                                    '"{1}/{0}"'.format(branch, remote_name))
+
+        if ours is None or base == ours:
+            self._repo.create_reference(local, theirs, force=True)
+            new = theirs
+        else:
+            new = self._merge(local, ours, theirs, base, author_name,
+                              author_email,
+                              "Merge branch '{0}' of {1}".format(branch,
+                                                                 remote_name))
+
+        self._update_refs([(local, ours and ours.hex or None, new.hex)])
+        return new.hex
+
+    def _merge(self, ref, ours, theirs, base, author_name, author_email,
+               message):
+        index = self._repo.merge_trees(self._repo[base].tree,
+                                       self._repo[ours].tree,
+                                       self._repo[theirs].tree)
+        if index.conflicts is not None:
+            paths = sorted(set(x.path for entries in index.conflicts
+                               for x in entries if x is not None))
+            raise MergeConflict('Merge conflicts: {0}'.format(', '.join(paths)))
 
-        if not remote:
-            raise NodeNotFound("Missing remote")
+        try:
+            author_name = author_name or self._repo.config['user.name']
+            author_email = author_email or self._repo.config['user.email']
+        except KeyError:
+            raise TamiaError('Merge commit needs an author')
 
-        return remote[0]
+        author = pygit2.Signature(author_name, author_email)
+        tree = index.write_tree(self._repo)
 
-    def pull(self, pull_remote, branch):
-        pass
+        return self._repo.create_commit(ref, author, author, message, tree,
+                                        [ours, theirs])
 
     @property
     def branches(self):
@@ -113,8 +316,86 @@ class Repository(object):
         for instance in self._repo.walk(initial.oid, sort):
             yield Revision(self, instance)
 
-    def diff(self, rev1, rev2):
-        return self.get_revision(rev1).node().diff(rev2)
+    def log(self, revision=None, author=None, since=None, until=None,
+            offset=0, limit=None):
+        """
+        Return a page of ``LogEntry`` for ``revision`` and its ancestors,
+        newest first. ``author`` filters on author name or email, ``since``
+        and ``until`` on commit date (datetime or timestamp).
+        """
+        if self._store is not None:
+            # References may have been moved by another process
+            self._store.update()
+
+            start = self._store.resolve(revision)
+            if start is None:
+                start = self.get_revision(revision).id
+
+            # Commits not reachable from references are not stored
+            if self._store.has(start):
+                return [LogEntry(self, x) for x in self._store.log(
+                    start, author, since, until, offset, limit)]
+
+        since = timestamp(since)
+        until = timestamp(until)
+
+        def matches(record):
+            return ((author is None or author in (record.author.name,
+                                                  record.author.email)) and
+                    (since is None or record.committer.time >= since) and
+                    (until is None or record.committer.time <= until))
+
+        initial = self.get_revision(revision)._commit
+        records = (commit_record(x) for x in
+                   self._repo.walk(initial.oid, pygit2.GIT_SORT_TIME))
+        stop = None if limit is None else offset + limit
+
+        return [LogEntry(self, x) for x in
+                islice((x for x in records if matches(x)), offset, stop)]
+
+    def analytics(self, rev_range, paths=None, workers=None, progress=None,
+                  checkpoint=None, chunk_size=100):
+        """
+        Return a ``ChurnStats`` with commits and changed lines per path and
+        per author email, for commits of ``rev_range`` (``"old..new"`` or a
+        single revision for all its history) diffed against their first
+        parent.
+
+        Commits are split in chunks of ``chunk_size`` analyzed by a pool of
+        ``workers`` processes. ``progress`` is called with the number of
+        analyzed commits and the total. With a ``checkpoint`` file, an
+        interrupted run resumes where it stopped.
+        """
+        old, sep, new = rev_range.rpartition('..')
+        walker = self._repo.walk(self.get_revision(new or None)._commit.oid,
+                                 pygit2.GIT_SORT_TOPOLOGICAL)
+        if old:
+            walker.hide(self.get_revision(old)._commit.oid)
+
+        if paths is not None:
+            paths = [clean_path(x) for x in paths]
+
+        return churn(self._repo, [x.hex for x in walker], paths, workers,
+                     progress, checkpoint, chunk_size)
+
+    def diff(self, rev1, rev2, **options):
+        return self.get_revision(rev1).node().diff(rev2, **options)
+
+    def changes(self, old_rev, new_rev, paths=None):
+        """
+        Yield a ``Change(status, path, old_oid, new_oid, mode)`` for each
+        file added, modified or deleted between two revisions, without
+        computing any patch. ``old_rev`` may be ``None`` to list every file
+        of ``new_rev`` as added. ``paths`` restricts changes to these files
+        or directories.
+        """
+        old = old_rev and self.get_revision(old_rev)._commit.tree.oid or None
+        new = self.get_revision(new_rev)._commit.tree.oid
+
+        if paths is not None:
+            paths = [clean_path(x) for x in paths]
+
+        return tree_changes(self._repo, old, new, paths)
 
     def __iter__(self):
         return self.history()
@@ -155,6 +436,136 @@ class Revision(object):
 
         return Node(self, path)
 
+    def read_many(self, paths, stream=False):
+        """
+        Read many files at once and yield ``(path, data)`` tuples, where data
+        is the file content (a ``FileBlob`` if ``stream`` is true) or an
+        exception instance if the path could not be read.
+
+        Paths are resolved in a single traversal of the revision tree and
+        each distinct blob is read once, in tree order. Reads are not spread
+        over threads: pygit2 holds the GIL while reading objects, so threads
+        would only add overhead.
+        """
+        repo = self._repository._repo
+        blobs = {}
+        order = []
+
+        requests = [(clean_path(x).split('/'), x) for x in paths]
+        for path, result in _resolve_many(repo, self._commit.tree, requests):
+            if isinstance(result, Exception):
+                yield path, result
+            elif result in blobs:
+                blobs[result].append(path)
+            else:
+                blobs[result] = [path]
+                order.append(result)
+
+        for oid in order:
+            blob = repo[oid]
+            for path in blobs[oid]:
+                # A FileBlob is a stream, each path needs its own
+                yield path, stream and FileBlob(blob) or blob.data
+
+
+def _get_remote(repo, name):
+    remote = [remote for remote in repo.remotes
+              if remote.name == name]
+
+    if not remote:
+        raise NodeNotFound("Missing remote")
+
+    return remote[0]
+
+
+def _fetch(repo, name, progress=None):
+    """
+    Fetch remote ``name`` of ``repo`` and return its name, transfer
+    statistics (or the raised exception) and updated references as
+    ``(refname, old oid, new oid)``. References updated before an error are
+    returned too.
+    """
+    changes = []
+    zero = '0' * 40
+
+    def update_tips(refname, old, new):
+        if isinstance(refname, bytes):
+            refname = refname.decode('UTF-8')
+        changes.append((refname,
+                        None if old.hex == zero else old.hex,
+                        None if new.hex == zero else new.hex))
+
+    try:
+        remote = _get_remote(repo, name)
+        remote.update_tips = update_tips
+        if progress is not None:
+            remote.transfer_progress = progress
+
+        stats = remote.fetch()
+    except Exception as e:
+        return (name, RemoteError('Cannot fetch "{0}": {1}'.format(name, e)),
+                changes)
+
+    return name, stats, changes
+
+
+def _resolve_many(repo, tree, requests):
+    """
+    Resolve ``(parts, path)`` requests in ``tree``, reading each subtree once,
+    and yield ``(path, blob oid)`` or ``(path, exception)``.
+    """
+    groups = {}
+    for parts, path in requests:
+        groups.setdefault(parts[0], []).append((parts[1:], path))
+
+    for name in sorted(groups):
+        items = groups[name]
+        try:
+            entry = tree[name]
+        except KeyError:
+            for parts, path in items:
+                yield path, NodeNotFound('Node "{0}" does not exist'.format(path))
+            continue
+
+        isdir = entry.filemode == pygit2.GIT_FILEMODE_TREE
+        deeper = []
+
+        for parts, path in items:
+            if parts and isdir:
+                deeper.append((parts, path))
+            elif parts:
+                yield path, NodeNotFound('Node "{0}" does not exist'.format(path))
+            elif isdir or entry.filemode == pygit2.GIT_FILEMODE_COMMIT:
+                yield path, TypeError('Node "{0}" is not a file'.format(path))
+            else:
+                yield path, entry.oid
+
+        if deeper:
+            for x in _resolve_many(repo, repo[entry.oid], deeper):
+                yield x
+
+
+class LogEntry(object):
+    """
+    Commit metadata as returned by ``Repository.log()``.
+    """
+    def __init__(self, repository, record):
+        self._repository = repository
+        self.id = record.id
+        self.short_id = self.id[:7]
+        self.parents = record.parents
+        self.author = Signature(record.author)
+        self.committer = Signature(record.committer)
+        self.subject = record.subject
+        self.offset = record.committer.offset
+        self.date = self.committer.date
+
+    def __repr__(self):
+        return b'<{0}: {1}>'.format(self.__class__.__name__, self.id)
+
+    def revision(self):
+        return self._repository.get_revision(self.id)
+
 
 class Signature(object):
     def __init__(self, sig):
@@ -183,13 +594,15 @@ class Node(object):
             self.name = ''
             self.type = self.DIR
         else:
+            repository = revision._repository
             try:
-                entry = revision._commit.tree[path]
+                oid, filemode = repository._path_cache.lookup(
+                    revision._commit.tree_id, path)
             except KeyError:
                 raise NodeNotFound('Node "{0}" does not exist'.format(path))
-            self._obj = revision._repository._repo.get(entry.oid)
+            self._obj = repository._repo.get(oid)
             self.name = path
-            self.type = entry.filemode in (16384, 57344) and self.DIR or self.FILE
+            self.type = filemode in (16384, 57344) and self.DIR or self.FILE
 
     def __unicode__(self):
         return self.name
@@ -236,19 +649,20 @@ class Node(object):
     def history(self, revision=None):
         initial = self._revision._repository.get_revision(revision or self._revision.id)._commit
         walker = self._revision._repository._repo.walk(initial.oid, pygit2.GIT_SORT_TIME)
+        lookup = self._revision._repository._path_cache.lookup
 
         last = None
         c0 = walker.next()
         try:
-            e0 = c0.tree[self.name]
+            e0 = lookup(c0.tree_id, self.name)
             last = c0
         except KeyError:
             e0 = None
 
         for c1 in walker:
             try:
-                e1 = c1.tree[self.name]
-                if e0 and e0.oid != e1.oid:
+                e1 = lookup(c1.tree_id, self.name)
+                if e0 and e0[0] != e1[0]:
                     yield Revision(self._revision._repository, c0)
             except KeyError:
                 e1 = None
@@ -261,8 +675,27 @@ class Node(object):
         if last:
             yield Revision(self._revision._repository, last)
 
-    def diff(self, revision):
-        return Diff(self, revision)
+    def diff(self, revision, **options):
+        return Diff(self, revision, **options)
+
+    def stats(self, largest=0):
+        """
+        Return the total size and file count of the node, with its
+        ``largest`` biggest files as ``(path, size)``.
+        """
+        stats = self._revision._repository._stats
+        obj = self._obj
+
+        if isinstance(obj, pygit2.Blob):
+            size = stats.blob_size(obj.oid)
+            return NodeStats(size, 1, [(self.name, size)][:largest])
+
+        if not isinstance(obj, pygit2.Tree):
+            return NodeStats(0, 0)
+
+        size, files, top = stats.tree(obj.oid, largest)
+        return NodeStats(size, files,
+                         [(os.path.join(self.name, p), n) for p, n in top])
 
 
 class FileBlob(object):
@@ -287,13 +720,15 @@ class FileBlob(object):
 
 
 class Diff(object):
-    def __init__(self, node, revision, reversed=False):
+    def __init__(self, node, revision, reversed=False, flags=0,
+                 context_lines=3, interhunk_lines=0):
         self._node = node
         self._t0 = node._revision._commit.tree
 
         self._rev = node._revision._repository.get_revision(revision)
         self._t1 = self._rev._commit.tree
 
+        self._options = (flags, context_lines, interhunk_lines)
         self._diff = None
 
     def __repr__(self):
@@ -313,40 +748,40 @@ class Diff(object):
         if self._diff is None:
             self._init_diff()
 
-        return self._diff.patch
+        return ''.join(x[2] for x in self._diff)
 
     def _init_diff(self):
-        self._diff = self._t1.diff_to_tree(self._t0)
+        cache = self._node._revision._repository._diff_cache
+        self._diff = cache.diff(self._t1, self._t0, self._options)
 
         files = {}
 
-        for p in self._diff:
+        for old_path, new_path, text, hunks in self._diff:
             if self._node.name and not (
-                p.old_file_path.startswith(self._node.name.encode('UTF-8')) or
-                p.new_file_path.startswith(self._node.name.encode('UTF-8'))
+                old_path.startswith(self._node.name) or
+                new_path.startswith(self._node.name)
             ):
                 continue
 
-            _id = '%s@%s' % (p.old_file_path.decode('UTF-8'),
-                             p.new_file_path.decode('UTF-8'))
+            _id = '%s@%s' % (old_path, new_path)
             if _id not in files:
-                files[_id] = Patch(p)
+                files[_id] = Patch(old_path, new_path)
 
-            for h in p.hunks:
-                files[_id].hunks.append(Hunk(h))
+            for h in hunks:
+                files[_id].hunks.append(Hunk(*h))
 
         self._files = files.values()
 
 
 class Patch(object):
-    def __init__(self, patch):
-        self.old_path = patch.old_file_path.decode('UTF-8')
-        self.new_path = patch.new_file_path.decode('UTF-8')
+    def __init__(self, old_path, new_path):
+        self.old_path = old_path
+        self.new_path = new_path
         self.hunks = []
 
 
 class Hunk(object):
-    def __init__(self, hunk):
-        self.old_start = hunk.old_start
-        self.new_start = hunk.new_start
-        self.lines = hunk.lines
+    def __init__(self, old_start, new_start, lines):
+        self.old_start = old_start
+        self.new_start = new_start
+        self.lines = lines
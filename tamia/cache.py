@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Tamia released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division,
+                        absolute_import, unicode_literals)
+
+from collections import OrderedDict
+from threading import Lock
+
+import pygit2
+
+
+class LRUCache(object):
+    """
+    A thread safe mapping keeping at most ``maxsize`` items, dropping the
+    least recently used ones first. With a ``weigh`` function, ``maxsize``
+    bounds the total weight of the values instead of their number.
+    """
+    def __init__(self, maxsize, weigh=None):
+        self.maxsize = maxsize
+        self.size = 0
+        self._weigh = weigh
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                item = self._data.pop(key)
+            except KeyError:
+                return default
+
+            self._data[key] = item
+            return item[0]
+
+    def __setitem__(self, key, value):
+        weight = self._weigh(value) if self._weigh else 1
+
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is not None:
+                self.size -= item[1]
+
+            self._data[key] = (value, weight)
+            self.size += weight
+
+            while self.size > self.maxsize and self._data:
+                self.size -= self._data.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+
+class PathCache(object):
+    """
+    Resolve paths in trees one component at a time, caching each
+    ``(tree oid, name)`` step. Trees are immutable, so entries are valid for
+    any revision sharing the same subtree.
+    """
+    def __init__(self, repo, maxsize):
+        self._repo = repo
+        self._entries = LRUCache(maxsize)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, tree_id, path):
+        """
+        Return ``(oid, filemode)`` of ``path`` in the tree ``tree_id``. Raise
+        ``KeyError`` if the path does not exist. Trees are only read from the
+        object database for uncached steps.
+        """
+        obj = None
+        oid = tree_id
+        filemode = pygit2.GIT_FILEMODE_TREE
+
+        for name in path.split('/'):
+            if filemode != pygit2.GIT_FILEMODE_TREE:
+                raise KeyError(path)
+
+            key = (oid, name)
+            value = self._entries.get(key)
+            if value is None:
+                if obj is None:
+                    obj = self._repo[oid]
+                entry = obj[name]
+                value = (entry.oid, entry.filemode)
+                self._entries[key] = value
+
+            oid, filemode = value
+            obj = None
+
+        return oid, filemode
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Tamia released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division,
+                        absolute_import, unicode_literals)
+
+from collections import namedtuple
+import os.path
+
+import pygit2
+
+
+Change = namedtuple('Change', 'status path old_oid new_oid mode')
+
+INSIDE = 1
+ANCESTOR = 2
+
+
+def _match(path, paths):
+    """
+    Tell whether ``path`` is inside one of ``paths`` or is an ancestor
+    directory of one of them.
+    """
+    result = None
+    for p in paths:
+        if path == p or path.startswith(p + '/'):
+            return INSIDE
+        if p.startswith(path + '/'):
+            result = ANCESTOR
+
+    return result
+
+
+def _entries(repo, oid):
+    if oid is None:
+        return {}
+
+    return dict((entry.name, entry) for entry in repo[oid])
+
+
+def tree_changes(repo, old, new, paths=None, prefix=''):
+    """
+    Yield a :class:`Change` for each file added (``A``), modified (``M``)
+    or deleted (``D``) between trees ``old`` and ``new`` (oids, or ``None``
+    for an empty tree).
+
+    Subtrees with the same oid on both sides are skipped without being read,
+    so the cost depends on the size of the change, not of the trees.
+    """
+    old_entries = _entries(repo, old)
+    new_entries = _entries(repo, new)
+
+    for name in sorted(set(old_entries) | set(new_entries)):
+        path = os.path.join(prefix, name.decode('UTF-8'))
+        e0 = old_entries.get(name)
+        e1 = new_entries.get(name)
+
+        if e0 is not None and e1 is not None and e0.oid == e1.oid \
+                and e0.filemode == e1.filemode:
+            continue
+
+        scope = INSIDE if paths is None else _match(path, paths)
+        if scope is None:
+            continue
+
+        tree0 = e0 is not None and e0.filemode == pygit2.GIT_FILEMODE_TREE
+        tree1 = e1 is not None and e1.filemode == pygit2.GIT_FILEMODE_TREE
+
+        if tree0 or tree1:
+            subpaths = None if scope == INSIDE else paths
+            for change in tree_changes(repo,
+                                       e0.oid if tree0 else None,
+                                       e1.oid if tree1 else None,
+                                       subpaths, path):
+                yield change
+
+        if scope != INSIDE:
+            continue
+
+        blob0 = None if tree0 else e0
+        blob1 = None if tree1 else e1
+
+        if blob0 is not None and blob1 is not None:
+            yield Change('M', path, blob0.hex, blob1.hex, blob1.filemode)
+        elif blob0 is not None:
+            yield Change('D', path, blob0.hex, None, blob0.filemode)
+        elif blob1 is not None:
+            yield Change('A', path, None, blob1.hex, blob1.filemode)
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Tamia released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division,
+                        absolute_import, unicode_literals)
+
+import cPickle as pickle
+from hashlib import sha1
+import os
+import os.path
+from tempfile import mkstemp
+
+import pygit2
+
+from .cache import LRUCache
+
+
+def _weigh(records):
+    # Text plus hunk lines, which hold about the same amount of data
+    return sum(2 * len(x[2]) + 100 for x in records)
+
+
+def _split_patch(text):
+    """
+    Split a patch in one text per file.
+    """
+    if not text:
+        return []
+
+    if isinstance(text, bytes):
+        text = text.decode('UTF-8')
+
+    result = []
+    for line in text.splitlines(True):
+        if line.startswith('diff --git ') or not result:
+            result.append([])
+        result[-1].append(line)
+
+    return [''.join(x) for x in result]
+
+
+def _move(records, old, new):
+    """
+    Replace the ``old`` path prefix of records by ``new``.
+    """
+    result = []
+    for old_path, new_path, text, hunks in records:
+        moved_old = new + old_path[len(old):]
+        moved_new = new + new_path[len(old):]
+
+        lines = text.splitlines(True)
+        for i, line in enumerate(lines):
+            if line.startswith('@@'):
+                break
+            if line.startswith('diff --git '):
+                line = 'diff --git a/{0} b/{1}\n'.format(moved_old, moved_new)
+            elif line.startswith('--- a/'):
+                line = '--- a/{0}\n'.format(moved_old)
+            elif line.startswith('+++ b/'):
+                line = '+++ b/{0}\n'.format(moved_new)
+            elif line.startswith('Binary files '):
+                line = line.replace(' a/{0} '.format(old_path),
+                                    ' a/{0} '.format(moved_old), 1)
+                line = line.replace(' b/{0} '.format(new_path),
+                                    ' b/{0} '.format(moved_new), 1)
+            lines[i] = line
+
+        result.append((moved_old, moved_new, ''.join(lines), hunks))
+
+    return result
+
+
+class MemoryStore(LRUCache):
+    """
+    In-process diff store bounded by an approximate size in bytes.
+    """
+    def __init__(self, maxbytes):
+        super(MemoryStore, self).__init__(maxbytes, _weigh)
+        self.maxbytes = maxbytes
+
+
+class DiskStore(object):
+    """
+    Diff store keeping one pickle file per key in a directory, so several
+    processes can share it. Files are replaced atomically and the least
+    recently read ones are removed when the store grows over ``maxbytes``.
+    """
+    def __init__(self, path, maxbytes):
+        self.path = path
+        self.maxbytes = maxbytes
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self.size = sum(x[2] for x in self._files())
+
+    def _files(self):
+        result = []
+        for name in os.listdir(self.path):
+            filename = os.path.join(self.path, name)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            result.append((st.st_mtime, filename, st.st_size))
+
+        return result
+
+    def _filename(self, key):
+        return os.path.join(self.path, sha1(key.encode('UTF-8')).hexdigest())
+
+    def get(self, key, default=None):
+        filename = self._filename(key)
+        try:
+            with open(filename, 'rb') as fp:
+                value = pickle.load(fp)
+            os.utime(filename, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return default
+
+        return value
+
+    def __setitem__(self, key, value):
+        fd, tmp = mkstemp(dir=self.path, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as fp:
+            pickle.dump(value, fp, pickle.HIGHEST_PROTOCOL)
+            self.size += fp.tell()
+        os.rename(tmp, self._filename(key))
+
+        if self.size > self.maxbytes:
+            self._evict()
+
+    def _evict(self):
+        files = sorted(x for x in self._files()
+                       if not os.path.basename(x[1]).startswith('.tmp'))
+        self.size = sum(x[2] for x in files)
+
+        # Make room for a while instead of evicting on each write
+        for mtime, filename, size in files:
+            if self.size <= self.maxbytes * 0.9:
+                break
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass
+            self.size -= size
+
+
+class DiffCache(object):
+    """
+    Cache diff results by ``(old tree oid, new tree oid, options)``.
+
+    A result is a list of ``(old_path, new_path, text, hunks)`` records with
+    paths relative to the diffed trees. When a pair of trees is not cached,
+    its result is composed from cached results of its differing subtree
+    pairs if possible. Otherwise the diff is computed and stored along with
+    the results of each of its differing subtree pairs.
+    """
+    def __init__(self, repo, store):
+        self._repo = repo
+        self.store = store
+
+    def _key(self, a, b, options):
+        return '{0}:{1}:{2}:{3}:{4}'.format(a.hex, b.hex, *options)
+
+    def _pairs(self, a, b):
+        """
+        Return ``(name, oid a, oid b)`` of the differing subtrees of two
+        trees, or ``None`` if files differ at this level.
+        """
+        entries_a = dict((x.name, x) for x in self._repo[a])
+        entries_b = dict((x.name, x) for x in self._repo[b])
+        result = []
+
+        def key(name):
+            # Git orders trees as if their name ended with a slash
+            for entry in (entries_a.get(name), entries_b.get(name)):
+                if entry is not None \
+                        and entry.filemode == pygit2.GIT_FILEMODE_TREE:
+                    return name + b'/'
+            return name
+
+        for name in sorted(set(entries_a) | set(entries_b), key=key):
+            ea = entries_a.get(name)
+            eb = entries_b.get(name)
+            if ea is not None and eb is not None and ea.oid == eb.oid \
+                    and ea.filemode == eb.filemode:
+                continue
+
+            if ea is None or eb is None \
+                    or ea.filemode != pygit2.GIT_FILEMODE_TREE \
+                    or eb.filemode != pygit2.GIT_FILEMODE_TREE:
+                return None
+
+            result.append((name.decode('UTF-8'), ea.oid, eb.oid))
+
+        return result
+
+    def diff(self, a, b, options=(0, 3, 0)):
+        """
+        Return records of the diff from tree ``a`` to tree ``b``. ``options``
+        are the ``(flags, context_lines, interhunk_lines)`` of the diff.
+        """
+        options = tuple(options)
+        records = self._lookup(a.oid, b.oid, options)
+        if records is None:
+            records = self._compute(a, b, options)
+
+        return records
+
+    def _lookup(self, a, b, options):
+        key = self._key(a, b, options)
+        records = self.store.get(key)
+        if records is not None:
+            return records
+
+        pairs = self._pairs(a, b)
+        if not pairs:
+            return None
+
+        records = []
+        for name, sub_a, sub_b in pairs:
+            sub = self._lookup(sub_a, sub_b, options)
+            if sub is None:
+                return None
+            records.extend(_move(sub, '', name + '/'))
+
+        self.store[key] = records
+        return records
+
+    def _compute(self, a, b, options):
+        diff = a.diff_to_tree(b, *options)
+        records = []
+
+        for p, text in zip(diff, _split_patch(diff.patch)):
+            hunks = [(h.old_start, h.new_start, h.lines) for h in p.hunks]
+            records.append((p.old_file_path.decode('UTF-8'),
+                            p.new_file_path.decode('UTF-8'),
+                            text, hunks))
+
+        self._seed(a.oid, b.oid, records, options)
+        return records
+
+    def _seed(self, a, b, records, options):
+        # Sub-pairs repeat the records of their parent, skip them when they
+        # would not fit next to it in the store.
+        if _weigh(records) * 2 <= self.store.maxbytes:
+            entries_a = dict((x.name, x) for x in self._repo[a])
+            entries_b = dict((x.name, x) for x in self._repo[b])
+
+            for name in set(entries_a) & set(entries_b):
+                ea = entries_a[name]
+                eb = entries_b[name]
+                if ea.oid == eb.oid or ea.filemode != pygit2.GIT_FILEMODE_TREE \
+                        or eb.filemode != pygit2.GIT_FILEMODE_TREE:
+                    continue
+
+                prefix = name.decode('UTF-8') + '/'
+                sub = [x for x in records
+                       if x[0].startswith(prefix) and x[1].startswith(prefix)]
+                self._seed(ea.oid, eb.oid, _move(sub, prefix, ''), options)
+
+        # Stored last so it is the most recently used entry
+        self.store[self._key(a, b, options)] = records
@@ -24,3 +24,11 @@ class RevisionNotFound(TamiaError):
 
 class IdxError(TamiaError):
     pass
+
+
+class RemoteError(TamiaError):
+    pass
+
+
+class MergeConflict(TamiaError):
+    pass
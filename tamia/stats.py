@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Tamia released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division,
+                        absolute_import, unicode_literals)
+
+from heapq import nlargest
+import os.path
+import shelve
+
+import pygit2
+
+from .cache import LRUCache
+
+
+class NodeStats(object):
+    def __init__(self, size, files, largest=None):
+        self.size = size
+        self.files = files
+        self.largest = largest or []
+
+    def __repr__(self):
+        return '<{0}: {1} files, {2} bytes>'.format(self.__class__.__name__,
+                                                   self.files, self.size)
+
+
+class StatsCache(object):
+    """
+    Aggregate sizes and file counts of trees, memoized by tree oid so a
+    subtree shared by several revisions is only computed once.
+
+    Aggregates can also be kept in a persistent store with :meth:`open`,
+    letting a new process reuse previous computations. The store is synced
+    after each :meth:`tree` call and must be closed with :meth:`close`.
+    """
+    def __init__(self, repo, maxsize):
+        self._repo = repo
+        self._trees = LRUCache(maxsize)
+        self._tops = LRUCache(maxsize)
+        self._blobs = LRUCache(maxsize)
+        self._store = None
+
+    def open(self, path):
+        self.close()
+
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        self._store = shelve.open(path.encode('UTF-8'))
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def blob_size(self, oid):
+        size = self._blobs.get(oid)
+        if size is None:
+            size = self._repo[oid].size
+            self._blobs[oid] = size
+
+        return size
+
+    def tree(self, oid, largest=0):
+        """
+        Return ``(size, files, largest)`` for tree ``oid``, where ``largest``
+        lists the ``(path, size)`` of its biggest files, relative to the tree.
+        """
+        size, files = self._totals(oid)
+        top = largest and self._largest(oid, largest) or []
+
+        if self._store is not None:
+            self._store.sync()
+
+        return size, files, top
+
+    def _get(self, cache, key):
+        value = cache.get(key)
+        if value is None and self._store is not None:
+            value = self._store.get(key.encode('UTF-8'))
+            if value is not None:
+                cache[key] = value
+
+        return value
+
+    def _set(self, cache, key, value):
+        cache[key] = value
+        if self._store is not None:
+            self._store[key.encode('UTF-8')] = value
+
+    def _entries(self, oid):
+        for entry in self._repo[oid]:
+            if entry.filemode != pygit2.GIT_FILEMODE_COMMIT:
+                yield (entry.name.decode('UTF-8'), entry.oid,
+                       entry.filemode == pygit2.GIT_FILEMODE_TREE)
+
+    def _totals(self, oid):
+        key = 'totals:{0}'.format(oid.hex)
+        value = self._get(self._trees, key)
+        if value is not None:
+            return value
+
+        size = 0
+        files = 0
+        for name, child, isdir in self._entries(oid):
+            if isdir:
+                s, f = self._totals(child)
+                size += s
+                files += f
+            else:
+                size += self.blob_size(child)
+                files += 1
+
+        self._set(self._trees, key, (size, files))
+        return size, files
+
+    def _largest(self, oid, largest):
+        # The longest list computed so far is kept, shorter requests are
+        # answered by truncating it.
+        key = 'largest:{0}'.format(oid.hex)
+        value = self._get(self._tops, key)
+        if value is not None and value[0] >= largest:
+            return value[1][:largest]
+
+        top = []
+        for name, child, isdir in self._entries(oid):
+            if isdir:
+                top.extend((os.path.join(name, p), n)
+                           for p, n in self._largest(child, largest))
+            else:
+                top.append((name, self.blob_size(child)))
+
+        top = nlargest(largest, top, key=lambda x: x[1])
+        self._set(self._tops, key, (largest, top))
+        return top
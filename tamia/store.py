@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Tamia released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division,
+                        absolute_import, unicode_literals)
+
+from collections import namedtuple
+import os.path
+import sqlite3
+
+import pygit2
+
+from .utils import timestamp
+
+
+SignatureRecord = namedtuple('SignatureRecord', 'name email time offset')
+CommitRecord = namedtuple('CommitRecord', 'id parents author committer subject')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commits (
+    id TEXT PRIMARY KEY,
+    author_name TEXT,
+    author_email TEXT,
+    author_time INTEGER,
+    author_offset INTEGER,
+    committer_name TEXT,
+    committer_email TEXT,
+    commit_time INTEGER,
+    commit_offset INTEGER,
+    subject TEXT
+);
+CREATE INDEX IF NOT EXISTS commits_time ON commits (commit_time);
+CREATE TABLE IF NOT EXISTS parents (
+    id TEXT,
+    parent TEXT,
+    position INTEGER,
+    PRIMARY KEY (id, position)
+);
+CREATE TABLE IF NOT EXISTS refs (
+    name TEXT PRIMARY KEY,
+    ref_target TEXT,
+    target TEXT
+);
+"""
+
+LOG_QUERY = """
+WITH RECURSIVE ancestors(id) AS (
+    VALUES(?)
+    UNION
+    SELECT parents.parent FROM parents
+    JOIN ancestors ON parents.id = ancestors.id
+)
+SELECT commits.* FROM commits
+JOIN ancestors ON commits.id = ancestors.id
+WHERE {0}
+ORDER BY commits.commit_time DESC, commits.id
+LIMIT ? OFFSET ?
+"""
+
+
+def commit_record(commit):
+    return CommitRecord(
+        commit.hex,
+        [x.hex for x in commit.parent_ids],
+        SignatureRecord(commit.author.name, commit.author.email,
+                        commit.author.time, commit.author.offset),
+        SignatureRecord(commit.committer.name, commit.committer.email,
+                        commit.commit_time, commit.commit_time_offset),
+        commit.message.split('\n', 1)[0],
+    )
+
+
+class CommitStore(object):
+    """
+    A SQLite sidecar holding commit metadata, so log queries do not have to
+    read commits from the object database.
+
+    The store is kept closed under ancestry: a stored commit always has its
+    parents stored, which lets :meth:`update` only walk commits reachable
+    from new references.
+    """
+    def __init__(self, repo, path):
+        self._repo = repo
+        self.path = path
+
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def _refs(self, stored):
+        """
+        Return ``{name: (target, commit id)}`` of repository references.
+        Only references moved since ``stored`` are peeled to their commit,
+        others are answered from reference files alone.
+        """
+        refs = {}
+        for name in self._repo.listall_references():
+            try:
+                target = self._repo.lookup_reference(name).resolve().target.hex
+            except KeyError:
+                continue
+
+            if name in stored and stored[name][0] == target:
+                refs[name] = stored[name]
+                continue
+
+            try:
+                commit = self._repo.revparse_single(target + '^{commit}').hex
+            except KeyError:
+                continue
+
+            refs[name] = (target, commit)
+
+        return refs
+
+    def _stored_refs(self):
+        return dict((name, (target, commit)) for name, target, commit in
+                    self._db.execute('SELECT name, ref_target, target FROM refs'))
+
+    def has(self, oid):
+        return self._db.execute('SELECT 1 FROM commits WHERE id = ?',
+                                (oid,)).fetchone() is not None
+
+    def update(self):
+        """
+        Store commits reachable from references and not stored yet. Return
+        the number of new commits.
+        """
+        stored = self._stored_refs()
+        refs = self._refs(stored)
+        if refs == stored:
+            return 0
+
+        targets = set(x[1] for x in refs.values())
+        tips = [x for x in targets if not self.has(x)]
+        # Previous targets are hidden as well: a moved branch no longer
+        # points at them, but their history is already stored.
+        known = targets.difference(tips)
+        known.update(x[1] for x in stored.values() if self.has(x[1]))
+        count = 0
+
+        with self._db:
+            if tips:
+                walker = self._repo.walk(pygit2.Oid(hex=tips[0]),
+                                         pygit2.GIT_SORT_NONE)
+                for tip in tips[1:]:
+                    walker.push(pygit2.Oid(hex=tip))
+                for oid in known:
+                    walker.hide(pygit2.Oid(hex=oid))
+
+                for commit in walker:
+                    self._insert(commit_record(commit))
+                    count += 1
+
+            self._db.execute('DELETE FROM refs')
+            self._db.executemany('INSERT INTO refs VALUES (?, ?, ?)',
+                                 [(name, target, commit) for name, (target, commit)
+                                  in refs.items()])
+
+        return count
+
+    def _insert(self, record):
+        self._db.execute(
+            'INSERT OR REPLACE INTO commits VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (record.id,
+             record.author.name, record.author.email,
+             record.author.time, record.author.offset,
+             record.committer.name, record.committer.email,
+             record.committer.time, record.committer.offset,
+             record.subject))
+        self._db.executemany('INSERT OR REPLACE INTO parents VALUES (?, ?, ?)',
+                             [(record.id, p, i)
+                              for i, p in enumerate(record.parents)])
+
+    def rebuild(self):
+        with self._db:
+            for table in ('commits', 'parents', 'refs'):
+                self._db.execute('DELETE FROM {0}'.format(table))
+
+        return self.update()
+
+    def check(self):
+        """
+        Return ``True`` if stored references match the repository ones and
+        every stored commit has its parents stored.
+        """
+        # Peel every reference instead of trusting stored commits
+        if self._refs({}) != self._stored_refs():
+            return False
+
+        missing = self._db.execute(
+            'SELECT COUNT(*) FROM refs WHERE target NOT IN (SELECT id FROM commits)'
+        ).fetchone()[0]
+        missing += self._db.execute(
+            'SELECT COUNT(*) FROM parents WHERE parent NOT IN (SELECT id FROM commits)'
+        ).fetchone()[0]
+
+        return missing == 0
+
+    def resolve(self, revision=None):
+        """
+        Return the commit id of a reference name or commit id using stored
+        references, or ``None`` if unknown.
+        """
+        if revision in (None, 'HEAD'):
+            head = self._repo.lookup_reference('HEAD').resolve()
+            return head.target.hex
+
+        if self.has(revision):
+            return revision
+
+        for prefix in ('', 'refs/heads/', 'refs/tags/', 'refs/remotes/'):
+            row = self._db.execute('SELECT target FROM refs WHERE name = ?',
+                                   (prefix + revision,)).fetchone()
+            if row:
+                return row[0]
+
+        return None
+
+    def log(self, start, author=None, since=None, until=None,
+            offset=0, limit=None):
+        """
+        Return :class:`CommitRecord` of ``start`` ancestors, newest first.
+        """
+        where = ['1']
+        args = [start]
+
+        if author is not None:
+            where.append('(commits.author_name = ? OR commits.author_email = ?)')
+            args.extend([author, author])
+        if since is not None:
+            where.append('commits.commit_time >= ?')
+            args.append(timestamp(since))
+        if until is not None:
+            where.append('commits.commit_time <= ?')
+            args.append(timestamp(until))
+
+        args.extend([-1 if limit is None else limit, offset])
+        rows = self._db.execute(LOG_QUERY.format(' AND '.join(where)),
+                                args).fetchall()
+
+        parents = {}
+        for row in rows:
+            parents[row[0]] = []
+        for i in range(0, len(rows), 500):
+            ids = [x[0] for x in rows[i:i + 500]]
+            query = ('SELECT id, parent FROM parents WHERE id IN ({0}) '
+                     'ORDER BY id, position').format(', '.join('?' * len(ids)))
+            for _id, parent in self._db.execute(query, ids):
+                parents[_id].append(parent)
+
+        return [CommitRecord(row[0], parents[row[0]],
+                             SignatureRecord(*row[1:5]),
+                             SignatureRecord(*row[5:9]),
+                             row[9])
+                for row in rows]
@@ -5,8 +5,10 @@
 from __future__ import (print_function, division,
                         absolute_import, unicode_literals)
 
-from datetime import timedelta, tzinfo
+from calendar import timegm
+from datetime import datetime, timedelta, tzinfo
 import os.path
+import time
 
 
 def clean_path(path):
@@ -17,6 +19,18 @@ def clean_path(path):
     return path
 
 
+def timestamp(value):
+    """
+    Convert a datetime to a POSIX timestamp. Other values are returned as is.
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            return timegm(value.utctimetuple())
+        return int(time.mktime(value.timetuple()))
+
+    return value
+
+
 class TZ(tzinfo):
     def __init__(self, offset):
         self._offset = offset
@@ -4,8 +4,15 @@
 # See the LICENSE for more information.
 from __future__ import (print_function, division, absolute_import, unicode_literals)
 
-from tamia import Repository, NodeNotFound
+import os.path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import pygit2
+
+from tamia import Repository, NodeNotFound, RemoteError
 from tamia.api import Revision
+from tamia.index import Index
 
 from .utils import BaseTestCase
 
@@ -59,6 +66,74 @@ class BareTestCase(BaseTestCase):
 
         self.assertEqual(i+1, 5)
 
+    def test_path_cache(self):
+        revision = self.repo.get_revision()
+        names = [x.name for x in revision.node().children(True)]
+        cached = len(self.repo._path_cache)
+        self.assertTrue(cached > 0)
+
+        # Same tree, no new entry
+        for name in names:
+            self.assertEqual(revision.node(name).name, name)
+        self.assertEqual(len(self.repo._path_cache), cached)
+
+        self.assertRaises(NodeNotFound, revision.node, names[0] + '/missing')
+
+    def test_stats(self):
+        node = self.repo.get_revision().node()
+        files = [(x.name, len(x.open().read()))
+                 for x in node.children(True) if x.isfile()]
+
+        stats = node.stats(largest=2)
+        self.assertEqual(stats.files, len(files))
+        self.assertEqual(stats.size, sum(x[1] for x in files))
+        self.assertEqual([x[1] for x in stats.largest],
+                         sorted([x[1] for x in files], reverse=True)[:2])
+
+        name, size = files[0]
+        stats = self.repo.get_revision().node(name).stats()
+        self.assertEqual((stats.files, stats.size), (1, size))
+
+    def test_stats_store(self):
+        self.repo.enable_stats_store()
+        expected = self.repo.get_revision().node().stats(largest=2)
+        self.repo.close()
+
+        repo = Repository(self.REPO_PATH)
+        repo.enable_stats_store()
+        stats = repo.get_revision().node().stats(largest=1)
+        self.assertEqual((stats.size, stats.files),
+                         (expected.size, expected.files))
+        self.assertEqual(stats.largest, expected.largest[:1])
+        repo.close()
+
+    def test_read_many(self):
+        revision = self.repo.get_revision()
+        nodes = list(revision.node().children(True))
+        files = [x.name for x in nodes if x.isfile()]
+        dirs = [x.name for x in nodes if x.isdir()]
+        paths = files + files[:1] + dirs[:1] + ['missing', files[0] + '/x']
+
+        result = list(revision.read_many(paths))
+        self.assertEqual(sorted(x[0] for x in result), sorted(paths))
+
+        result = dict(result)
+        for name in files:
+            self.assertEqual(result[name], revision.node(name).open().read())
+        self.assertTrue(isinstance(result[dirs[0]], TypeError))
+        self.assertTrue(isinstance(result['missing'], NodeNotFound))
+        self.assertTrue(isinstance(result[files[0] + '/x'], NodeNotFound))
+
+    def test_read_many_stream(self):
+        revision = self.repo.get_revision()
+        name = [x.name for x in revision.node().children(True) if x.isfile()][0]
+        content = revision.node(name).open().read()
+
+        result = list(revision.read_many([name, name, './' + name], stream=True))
+        self.assertEqual(len(result), 3)
+        for path, blob in result:
+            self.assertEqual(blob.read(), content)
+
 
 class EmptyTestCase(BaseTestCase):
     TARFILE = 'emptyrepo.tar.gz'
@@ -161,3 +236,220 @@ class IndexTestCase(BaseTestCase):
 
         h = list(self.repo.history())
         self.assertEqual(h[0].message, 'Third commit ö')
+
+    def test_commit_store(self):
+        store = self.repo.enable_commit_store()
+        self.assertTrue(store.check())
+        self.assertEqual([x.id for x in self.repo.log()],
+                         [x.id for x in self.repo.history()])
+
+        index = Index(self.repo)
+        index.set_revision('HEAD')
+        index.add('test', 'Some content\n')
+        index.commit('Stored commit\n\nBody', 'Jane Doe', 'jane@example.net')
+
+        self.assertTrue(store.check())
+        log = self.repo.log(limit=2)
+        self.assertEqual([x.subject for x in log][0], 'Stored commit')
+        self.assertEqual(log[0].parents, [log[1].id])
+        self.assertEqual(log[0].revision().id, log[0].id)
+
+        log = self.repo.log(author='jane@example.net')
+        self.assertEqual(len(log), 1)
+        self.assertEqual(log[0].author.name, 'Jane Doe')
+
+        self.assertEqual([x.id for x in self.repo.log(offset=1)],
+                         [x.id for x in self.repo.history()][1:])
+
+        self.assertEqual(store.rebuild(), 3)
+        self.assertTrue(store.check())
+
+    def test_commit_store_external(self):
+        self.repo.enable_commit_store()
+
+        other = Repository(self.REPO_PATH)
+        index = Index(other)
+        index.set_revision('HEAD')
+        index.add('test', 'Some content\n')
+        index.commit('External commit', 'Jane Doe', 'jane@example.net')
+
+        self.assertEqual(self.repo.log(limit=1)[0].subject, 'External commit')
+        self.assertEqual(self.repo.log('master', limit=1)[0].subject,
+                         'External commit')
+        self.assertEqual([x.id for x in self.repo.log()],
+                         [x.id for x in self.repo.history()])
+
+    def test_commit_store_incremental(self):
+        store = self.repo.enable_commit_store()
+
+        other = Repository(self.REPO_PATH)
+        index = Index(other)
+        index.set_revision('HEAD')
+        index.add('test', 'Some content\n')
+        index.commit('External commit', 'Jane Doe', 'jane@example.net')
+
+        # The branch moved, only the new commit is walked
+        self.assertEqual(store.update(), 1)
+        self.assertEqual(store.update(), 0)
+        self.assertTrue(store.check())
+
+    def test_changes(self):
+        self._commit(self.repo, 'First', {'test/accentué': 'Some content\n'})
+
+        index = Index(self.repo)
+        index.set_revision('HEAD')
+        index.add('test/acc2é/acc3é', 'New content\n€\n')
+        index.remove('test/accentué')
+        index.add('test/acc-renamed', 'Some content\ntesté\n')
+        index.commit('Second', 'John Doe', 'john@example.net')
+
+        changes = list(self.repo.changes('HEAD~1', 'HEAD'))
+        self.assertEqual([(x.status, x.path) for x in changes], [
+            ('A', 'test/acc-renamed'),
+            ('A', 'test/acc2é/acc3é'),
+            ('D', 'test/accentué'),
+        ])
+        self.assertEqual(changes[1].new_oid,
+                         self.repo.get_revision().node('test/acc2é/acc3é')._obj.hex)
+        self.assertEqual(changes[2].new_oid, None)
+
+        changes = self.repo.changes('HEAD~1', 'HEAD', paths=['test/acc2é'])
+        self.assertEqual([x.path for x in changes], ['test/acc2é/acc3é'])
+
+        # Every file is added from an empty tree
+        files = [x.name for x in self.repo.get_revision().node().children(True)
+                 if x.isfile()]
+        changes = list(self.repo.changes(None, 'HEAD'))
+        self.assertEqual(sorted(x.path for x in changes), sorted(files))
+        self.assertEqual(set(x.status for x in changes), set(['A']))
+
+        # Mode only change
+        index = Index(self.repo)
+        index.set_revision('HEAD')
+        index.add('test/acc-renamed', 'Some content\ntesté\n', 755)
+        index.commit('Third', 'John Doe', 'john@example.net')
+
+        changes = list(self.repo.changes('HEAD~1', 'HEAD'))
+        self.assertEqual(len(changes), 1)
+        self.assertEqual((changes[0].status, changes[0].path, changes[0].mode),
+                         ('M', 'test/acc-renamed', 0o100755))
+        self.assertEqual(changes[0].old_oid, changes[0].new_oid)
+
+    def test_diff_cache(self):
+        self._commit(self.repo, 'First', {'a/x': 'one\n', 'b/y': 'one\n'})
+        self._commit(self.repo, 'Second', {'a/x': 'two\n'})
+        self._commit(self.repo, 'Third', {'b/y': 'two\n'})
+
+        first = self.repo.diff('HEAD~1', 'HEAD~2').patch
+        second = self.repo.diff('HEAD', 'HEAD~1').patch
+        self.assertTrue('a/a/x' in first and 'b/b/y' not in first)
+
+        # Composed from the two previous subtree diffs
+        composed = self.repo.diff('HEAD', 'HEAD~2')
+        self.assertEqual(composed.patch, first + second)
+        self.assertEqual(sorted(x.new_path for x in composed), ['a/x', 'b/y'])
+
+        self.repo.enable_diff_store()
+        self.assertEqual(self.repo.diff('HEAD', 'HEAD~2').patch, first + second)
+        self.assertEqual(self.repo.diff('HEAD', 'HEAD~2').patch, first + second)
+
+    def test_diff_cache_order(self):
+        self._commit(self.repo, 'First', {'a/x': 'one\n', 'a-b/y': 'one\n'})
+        self._commit(self.repo, 'Second', {'a/x': 'two\n'})
+        self._commit(self.repo, 'Third', {'a-b/y': 'two\n'})
+
+        expected = Repository(self.REPO_PATH).diff('HEAD', 'HEAD~2').patch
+
+        # Warm the cache with both subtree pairs, then compose
+        self.repo.diff('HEAD~1', 'HEAD~2').patch
+        self.repo.diff('HEAD', 'HEAD~1').patch
+        composed = self.repo.diff('HEAD', 'HEAD~2').patch
+
+        self.assertEqual(composed, expected)
+        self.assertTrue(expected.index('a/a-b/y') < expected.index('a/a/x'))
+
+    def test_analytics(self):
+        self._commit(self.repo, 'First', {'a/x': 'one\n', 'b/y': 'one\n'})
+        self._commit(self.repo, 'Second', {'a/x': 'two\nthree\n'})
+
+        stats = self.repo.analytics('HEAD~2..HEAD')
+        self.assertEqual(stats.commits, 2)
+        self.assertEqual(stats.paths, {'a/x': [2, 3, 1], 'b/y': [1, 1, 0]})
+        self.assertEqual(stats.authors, {'john@example.net': [2, 4, 1]})
+
+        stats = self.repo.analytics('HEAD~2..HEAD', paths=['b'], workers=2)
+        self.assertEqual(stats.paths, {'b/y': [1, 1, 0]})
+        self.assertEqual(stats.commits, 1)
+
+    def test_analytics_resume(self):
+        self._commit(self.repo, 'First', {'a/x': 'one\n'})
+        self._commit(self.repo, 'Second', {'a/x': 'two\n'})
+        checkpoint = os.path.join(self.REPO_PATH, 'churn.json')
+
+        def interrupt(done, total):
+            raise KeyboardInterrupt
+
+        self.assertRaises(KeyboardInterrupt, self.repo.analytics, 'HEAD~2..HEAD',
+                          progress=interrupt, checkpoint=checkpoint, chunk_size=1)
+        self.assertTrue(os.path.exists(checkpoint))
+
+        calls = []
+        stats = self.repo.analytics('HEAD~2..HEAD', checkpoint=checkpoint,
+                                    chunk_size=1,
+                                    progress=lambda *args: calls.append(args))
+        self.assertEqual(calls, [(2, 2)])
+        self.assertEqual(stats.paths, {'a/x': [2, 2, 1]})
+        self.assertFalse(os.path.exists(checkpoint))
+
+
+class RemoteTestCase(BaseTestCase):
+    TARFILE = 'barerepo.tar.gz'
+
+    def setUp(self):
+        super(RemoteTestCase, self).setUp()
+        self.upstream = Repository(self.REPO_PATH)
+        self.tmp = mkdtemp()
+        self.repo = Repository.clone(os.path.join(self.tmp, 'clone'),
+                                     self.REPO_PATH)
+
+    def tearDown(self):
+        rmtree(self.tmp)
+        super(RemoteTestCase, self).tearDown()
+
+    def test_pull_fast_forward(self):
+        head = self._commit(self.upstream, 'Upstream', {'a/x': 'x\n'})
+
+        self.assertEqual(self.repo.pull('origin', 'master'), head)
+        self.assertEqual(self.repo.get_revision('master').id, head)
+        self.assertEqual(self.repo.get_revision('master').branches, ['master'])
+        self.assertTrue('origin/master' in self.repo._ref_map[head]['remotes'])
+
+        # Already up to date
+        self.assertEqual(self.repo.pull('origin', 'master'), head)
+
+    def test_pull_merge(self):
+        theirs = self._commit(self.upstream, 'Upstream', {'a/x': 'x\n'})
+        ours = self._commit(self.repo, 'Local', {'b/y': 'y\n'})
+
+        head = self.repo.pull('origin', 'master', 'John Doe', 'john@example.net')
+        revision = self.repo.get_revision(head)
+        self.assertEqual([x.hex for x in revision._commit.parents], [ours, theirs])
+        revision.node('a/x')
+        revision.node('b/y')
+
+    def test_fetch_all(self):
+        head = self._commit(self.upstream, 'Upstream', {'a/x': 'x\n'})
+        calls = []
+
+        # Threads need a thread safe libgit2
+        workers = pygit2.features & pygit2.GIT_FEATURE_THREADS and 2 or None
+        result = self.repo.fetch_all(workers=workers,
+                                     progress=lambda *args: calls.append(args))
+        self.assertEqual(list(result), ['origin'])
+        self.assertTrue(result['origin'].received_objects > 0)
+        self.assertEqual(set(x[0] for x in calls), set(['origin']))
+        self.assertEqual(self.repo.get_revision('origin/master').id, head)
+        self.assertTrue('origin/master' in self.repo._ref_map[head]['remotes'])
+
+        result = self.repo.fetch_all(['missing'])
+        self.assertTrue(isinstance(result['missing'], RemoteError))
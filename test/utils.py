@@ -10,6 +10,8 @@ import tarfile
 from tempfile import mkdtemp
 from unittest import TestCase
 
+from tamia.index import Index
+
 
 class BaseTestCase(TestCase):
     TARFILE = None
@@ -27,3 +29,16 @@ class BaseTestCase(TestCase):
     def tearDown(self):
         if self.REPO_PATH:
             rmtree(self.REPO_PATH)
+
+    def _commit(self, repo, message, files):
+        """
+        Commit ``files`` (a path to contents mapping) on top of ``repo`` HEAD
+        and return the new head id.
+        """
+        index = Index(repo)
+        index.set_revision('HEAD')
+        for path, contents in files.items():
+            index.add(path, contents)
+        index.commit(message, 'John Doe', 'john@example.net')
+
+        return repo.get_revision().id